@@ -12,37 +12,57 @@ warnings.filterwarnings("ignore", category=FutureWarning)
 import pandas as pd
 from elasticsearch import Elasticsearch
 from sentence_transformers import SentenceTransformer
-import spacy
 from fastapi import FastAPI, HTTPException, Request
 import sqlite3
 from pydantic import BaseModel
 from textblob import TextBlob
 import sys
 import time
+from contextlib import asynccontextmanager
 from elasticsearch.helpers import bulk
 import uvicorn
 
-from config import DB_PATH, ES_HOST, SPACY_MODEL, SENTENCE_TRANSFORMER_MODEL, API_HOST, INDEXING_API_PORT
+from config import DB_PATH, ES_HOST, SENTENCE_TRANSFORMER_MODEL, API_HOST, INDEXING_API_PORT
+from textPreprocess import load_nlp, get_preprocess_mapping, get_sentiment_mapping, preprocess_documents, compute_sentiment
 
-# SQLite 연결 설정
-conn = sqlite3.connect(DB_PATH)
+# bulk 요청 및 진행 상황 출력 단위 문서 수
+INDEX_BATCH_SIZE = 1000
 
-# Elasticsearch 클라이언트 생성
-try:
-    es = Elasticsearch([ES_HOST])
-    es.info()
-except Exception as e:
-    print(f"Elasticsearch 연결 오류: {e}")
-    exit(1)
+conn = None
+es = None
+nlp = None
+model = None
 
-# spaCy 모델 로드
-nlp = spacy.load(SPACY_MODEL)
+def init_resources():
+    # nlp.pipe 멀티프로세스 워커(spawn/forkserver)가 이 모듈을 다시 import해도
+    # 연결 및 모델 로드가 반복되지 않도록 서버 시작 시에만 초기화
+    global conn, es, nlp, model
 
-# Sentence Transformer 모델 로드
-model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL)
+    # SQLite 연결 설정
+    conn = sqlite3.connect(DB_PATH)
+
+    # Elasticsearch 클라이언트 생성
+    try:
+        es = Elasticsearch([ES_HOST])
+        es.info()
+    except Exception as e:
+        print(f"Elasticsearch 연결 오류: {e}")
+        exit(1)
+
+    # spaCy 모델 로드 (전처리에 필요한 파이프만 활성화)
+    nlp = load_nlp()
+
+    # Sentence Transformer 모델 로드
+    model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL)
+
+@asynccontextmanager
+async def lifespan(app):
+    init_resources()
+    yield
+    conn.close()
 
 # FastAPI 앱 생성
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 def get_table_schema(table_name):
     cursor = conn.cursor()
@@ -72,9 +92,27 @@ def get_table_schema(table_name):
     
     return schema
 
-def create_index(table_name):
+def get_text_fields(schema):
+    return [field for field, properties in schema.items() if properties['type'] == 'text']
+
+def get_invalid_text_columns(table_name, columns):
+    text_fields = get_text_fields(get_table_schema(table_name))
+    return [column for column in columns if column not in text_fields]
+
+def create_index(table_name, preprocess_columns, sentiment_columns):
     index_name = f"{table_name.lower()}_index"  # 소문자로 변경
+    preprocess_mapping = get_preprocess_mapping(preprocess_columns)
+    preprocess_mapping.update(get_sentiment_mapping(sentiment_columns))
+
+    # 이어서 색인하는 경우 기존 인덱스에 전처리 필드 매핑을 추가
+    # (이미 동적 매핑으로 다른 타입이 지정된 경우 ES가 거부하므로 예외를 그대로 올려 색인을 중단)
+    if es.indices.exists(index=index_name):
+        es.indices.put_mapping(index=index_name, body={"properties": preprocess_mapping})
+        print(f"인덱스 '{index_name}' 전처리 필드 매핑 갱신.")
+        return
+
     schema = get_table_schema(table_name)
+    schema.update(preprocess_mapping)
     
     settings = {
         "settings": {
@@ -106,50 +144,53 @@ def get_last_indexed_id(table_name):
         print(f"마지막 색인 ID 조회 중 오류 발생: {e}")
         return 0
 
-def index_data(table_name, start_id=1):
+def index_data(table_name, preprocess_columns, sentiment_columns, start_id=1):
     print(f"{table_name} 테이블 데이터 색인 시작... (시작 ID: {start_id})")
     cursor = conn.cursor()
     cursor.execute(f"SELECT MAX(el_pri_key) FROM {table_name}")
     max_id = cursor.fetchone()[0]
     
-    batch_size = 100
-    total_indexed = 0
+    index_name = f"{table_name.lower()}_index"  # 소문자로 변경
+    total_count = max_id - start_id + 1
 
     start_time = time.time()
 
-    for current_id in range(start_id, max_id + 1, batch_size):
-        end_id = min(current_id + batch_size - 1, max_id)
-        
-        cursor.execute(f"SELECT * FROM {table_name} WHERE el_pri_key BETWEEN ? AND ?", (current_id, end_id))
-        columns = [column[0] for column in cursor.description]
-        
-        actions = []
-        for row in cursor.fetchall():
-            doc = {columns[i]: row[i] for i in range(len(columns))}
-            
-            actions.append({
-                "_index": f"{table_name.lower()}_index",  # 소문자로 변경
-                "_id": str(row[0]), 
+    # 테이블 전체를 하나의 스트림으로 읽어 전처리 후 bulk로 전달 (nlp.pipe 워커는 색인 작업당 한 번만 생성)
+    cursor.execute(f"SELECT * FROM {table_name} WHERE el_pri_key >= ? ORDER BY el_pri_key", (start_id,))
+    columns = [column[0] for column in cursor.description]
+    docs = ({columns[i]: row[i] for i in range(len(columns))} for row in cursor)
+
+    # 텍스트 컬럼의 lemma/명사 키워드 필드 및 감성 점수 필드 추가
+    docs = preprocess_documents(nlp, docs, preprocess_columns)
+    docs = compute_sentiment(docs, sentiment_columns)
+
+    def generate_actions():
+        for processed, doc in enumerate(docs, 1):
+            yield {
+                "_index": index_name,
+                "_id": str(doc['el_pri_key']), 
                 "_source": doc
-            })
-        
-        if actions:
-            try:
-                success, failed = bulk(es, actions, request_timeout=300)
-                if failed:
-                    print(f'문서 색인 실패: {len(failed)} 건')
-                    for item in failed:
-                        print(f"실패한 문서: {item}")  # 실패한 문서의 상세 정보 출력
-                total_indexed += success
-                print(f"진행 상황: {total_indexed} / {max_id - start_id + 1} 문서 색인 완료")
-            except Exception as e:
-                print(f"색인 중 오류 발생: {e}")
-        else:
-            print(f"ID 범위 {current_id}-{end_id}에 데이터가 없음.")
+            }
+            if processed % INDEX_BATCH_SIZE == 0:
+                print(f"진행 상황: {processed} / {total_count} 문서 처리 완료")
+
+    # 스트림 중간에 발생한 오류(spaCy 워커, TextBlob, ES 연결 등)는 일부만 색인된 상태이므로 완료로 보고하지 않음
+    try:
+        total_indexed, failed = bulk(es, generate_actions(), chunk_size=INDEX_BATCH_SIZE,
+                                     raise_on_error=False, request_timeout=300)
+    except Exception as e:
+        print(f"색인 중 오류 발생: {e}")
+        raise
 
     end_time = time.time()
     elapsed_time = end_time - start_time
-    print(f"데이터 색인 완료. 총 {total_indexed}개 문서 처리. 소요 시간: {elapsed_time:.2f}초")
+    print(f"데이터 색인 종료. 총 {total_indexed}개 문서 처리. 소요 시간: {elapsed_time:.2f}초")
+
+    if failed:
+        print(f'문서 색인 실패: {len(failed)} 건')
+        for item in failed:
+            print(f"실패한 문서: {item}")  # 실패한 문서의 상세 정보 출력
+        raise RuntimeError(f"문서 색인 실패: {len(failed)} 건 (성공 {total_indexed} 건)")
 
 def index_exists(table_name):
     return es.indices.exists(index=f"{table_name}_index")
@@ -178,25 +219,39 @@ async def index_table(request: Request):
         data = await request.json()
         table_name = data.get("table_name")
         is_continue = data.get("is_continue", "N")
+        # lemma/명사 전처리를 적용할 텍스트 컬럼 (예: ["SUMMARY_KOR", "TEXT_KOR"])
+        preprocess_columns = data.get("preprocess_columns", [])
+        # 감성 점수를 계산할 리뷰 본문 컬럼 (예: ["Summary", "Text"])
+        sentiment_columns = data.get("sentiment_columns", [])
         
         if not table_name:
             raise HTTPException(status_code=400, detail="테이블 이름이 제공되지 않았습니다.")
         
+        invalid_columns = get_invalid_text_columns(table_name, preprocess_columns)
+        if invalid_columns:
+            raise HTTPException(status_code=400, detail=f"텍스트 컬럼이 아닌 전처리 컬럼: {invalid_columns}")
+        
+        invalid_columns = get_invalid_text_columns(table_name, sentiment_columns)
+        if invalid_columns:
+            raise HTTPException(status_code=400, detail=f"텍스트 컬럼이 아닌 감성 분석 컬럼: {invalid_columns}")
+        
         if is_continue.upper() == 'Y':
             if index_exists(table_name):
                 last_indexed_id = get_last_indexed_id(table_name)
-                create_index(table_name)
-                index_data(table_name, start_id=last_indexed_id + 1)
+                create_index(table_name, preprocess_columns, sentiment_columns)
+                index_data(table_name, preprocess_columns, sentiment_columns, start_id=last_indexed_id + 1)
             else:
-                create_index(table_name)
-                index_data(table_name)
+                create_index(table_name, preprocess_columns, sentiment_columns)
+                index_data(table_name, preprocess_columns, sentiment_columns)
         else:  # 'N' 또는 다른 값
             if index_exists(table_name):
                 delete_index(table_name)
-            create_index(table_name)
-            index_data(table_name)
+            create_index(table_name, preprocess_columns, sentiment_columns)
+            index_data(table_name, preprocess_columns, sentiment_columns)
         
         return {"message": f"{table_name} 테이블 색인 완료"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,11 +1,12 @@
-from fastapi import FastAPI, Query
-from pydantic import BaseModel
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, Field
 from elasticsearch import Elasticsearch
 from sentence_transformers import SentenceTransformer
-from textblob import TextBlob
 from googletrans import Translator
 
 from config import ES_HOST, SENTENCE_TRANSFORMER_MODEL, API_HOST, SEARCH_API_PORT
+from textPreprocess import load_nlp, extract_keywords, LEMMA_SUFFIX, NOUNS_SUFFIX, SENTIMENT_FIELD
 
 app = FastAPI()
 
@@ -18,10 +19,17 @@ model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL)
 # Google 번역기 초기화
 translator = Translator()
 
+# 색인 시와 동일한 전처리를 쿼리에 적용하기 위한 spaCy 모델 로드
+nlp = load_nlp()
+
 class SearchRequest(BaseModel):
     query: str
     index: str
     is_eng: str
+    sentiment_min: Optional[float] = Field(None, ge=-1.0, le=1.0)
+    sentiment_max: Optional[float] = Field(None, ge=-1.0, le=1.0)
+    # 지정 시 이 감성 점수에 가까운 문서를 부스팅
+    sentiment_origin: Optional[float] = Field(None, ge=-1.0, le=1.0)
 
 @app.post("/search")
 async def search(request: SearchRequest):
@@ -29,6 +37,10 @@ async def search(request: SearchRequest):
     index = request.index
     is_eng = request.is_eng
     
+    if (request.sentiment_min is not None and request.sentiment_max is not None
+            and request.sentiment_min > request.sentiment_max):
+        raise HTTPException(status_code=400, detail="sentiment_min이 sentiment_max보다 큽니다.")
+
     # 영어 번역 옵션이 켜져 있을 경우에만 번역
     if is_eng.upper() == 'Y':
         query = translator.translate(query, dest='en').text
@@ -36,26 +48,89 @@ async def search(request: SearchRequest):
 
     
     query_embedding = model.encode(query).tolist()
-    
-    # TextBlob을 사용하여 쿼리의 감성 분석
-    query_sentiment = TextBlob(query).sentiment.polarity
 
-    # 인덱스의 매핑 정보를 가져와 텍스트 필드 추출
+    # 인덱스의 매핑 정보를 가져와 텍스트 필드 및 전처리 필드 추출
     mapping = es.indices.get_mapping(index=index)
-    text_fields = [field for field, properties in mapping[index]['mappings']['properties'].items() 
-                   if properties.get('type') == 'text']
+    properties = mapping[index]['mappings']['properties']
+    text_fields = [field for field, field_properties in properties.items() 
+                   if field_properties.get('type') == 'text' and not field.endswith(LEMMA_SUFFIX)]
+    lemma_fields = [field for field in properties if field.endswith(LEMMA_SUFFIX)]
+    nouns_fields = [field for field in properties if field.endswith(NOUNS_SUFFIX)]
     print(f"추출된 텍스트 필드: {text_fields}")
 
-    search_body = {
-        "_source": {"excludes": ["embedding"]},
-        "query": {
+    # 전처리 필드가 있는 인덱스에서만 쿼리의 lemma/명사 키워드 추출 (색인 시 전처리와 동일)
+    use_preprocess = bool(lemma_fields or nouns_fields)
+    query_lemma, query_nouns = "", []
+    if use_preprocess:
+        query_lemma, query_nouns = extract_keywords(nlp(query))
+
+    use_sentiment = (request.sentiment_min is not None or request.sentiment_max is not None
+                     or request.sentiment_origin is not None)
+    if use_sentiment and SENTIMENT_FIELD not in properties:
+        raise HTTPException(status_code=400, detail=f"인덱스 '{index}'에 감성 점수 필드가 없습니다.")
+
+    text_match = {
+        "query": query,
+        "fields": text_fields,
+        "minimum_should_match": "50%"
+    }
+    # 전처리 필드가 없는 인덱스는 기존처럼 fuzziness로 검색
+    if not use_preprocess:
+        text_match["fuzziness"] = 2
+    should = [{"multi_match": text_match}]
+
+    # fuzziness 대신 전처리된 lemma/명사 필드에 대한 정확 일치로 검색
+    if lemma_fields and query_lemma:
+        should.append({
             "multi_match": {
-                "query": query,
-                "fields": text_fields,
-                "fuzziness": 2,  
-                "minimum_should_match": "50%"  
+                "query": query_lemma,
+                "fields": lemma_fields,
+                "minimum_should_match": "50%"
+            }
+        })
+    if nouns_fields and query_nouns:
+        should.extend({"terms": {field: query_nouns}} for field in nouns_fields)
+
+    # 색인 시 저장된 감성 점수로 범위 필터 (스코어 계산에 영향 없는 filter 컨텍스트)
+    filters = []
+    sentiment_range = {}
+    if request.sentiment_min is not None:
+        sentiment_range["gte"] = request.sentiment_min
+    if request.sentiment_max is not None:
+        sentiment_range["lte"] = request.sentiment_max
+    if sentiment_range:
+        filters.append({"range": {SENTIMENT_FIELD: sentiment_range}})
+
+    search_query = {
+        "bool": {
+            "should": should,
+            "minimum_should_match": 1,
+            "filter": filters
+        }
+    }
+
+    # 요청한 감성 점수에 가까운 문서를 부스팅
+    if request.sentiment_origin is not None:
+        search_query = {
+            "function_score": {
+                "query": search_query,
+                "functions": [{
+                    # 감성 점수가 없는 문서는 decay 함수가 최대값(1)을 주므로 부스팅 대상에서 제외
+                    "filter": {"exists": {"field": SENTIMENT_FIELD}},
+                    "gauss": {
+                        SENTIMENT_FIELD: {
+                            "origin": request.sentiment_origin,
+                            "scale": 0.5
+                        }
+                    }
+                }],
+                "boost_mode": "multiply"
             }
         }
+
+    search_body = {
+        "_source": {"excludes": ["embedding", f"*{LEMMA_SUFFIX}", f"*{NOUNS_SUFFIX}"]},
+        "query": search_query
     }
 
     
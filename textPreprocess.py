@@ -0,0 +1,90 @@
+from collections import deque
+
+import spacy
+from textblob import TextBlob
+
+import config
+from config import SPACY_MODEL
+
+# 기존 config.py에 설정이 없으면 단일 프로세스로 처리
+SPACY_N_PROCESS = getattr(config, "SPACY_N_PROCESS", 1)
+
+# 색인/검색 전처리에는 lemma와 품사만 필요하므로 parser, ner 파이프는 로드하지 않음
+EXCLUDED_PIPES = ["parser", "ner"]
+NOUN_POS = {"NOUN", "PROPN"}
+
+# 전처리 결과가 저장될 필드 접미사
+LEMMA_SUFFIX = "_lemma"
+NOUNS_SUFFIX = "_nouns"
+
+# 문서 감성 점수(-1.0 ~ 1.0) 필드
+SENTIMENT_FIELD = "el_sentiment"
+
+# nlp.pipe 설정
+NLP_BATCH_SIZE = 256
+
+def load_nlp():
+    return spacy.load(SPACY_MODEL, exclude=EXCLUDED_PIPES)
+
+def extract_keywords(doc):
+    lemmas = []
+    nouns = []
+    for token in doc:
+        if token.is_punct or token.is_space:
+            continue
+        lemma = (token.lemma_ or token.text).lower()
+        lemmas.append(lemma)
+        if token.pos_ in NOUN_POS:
+            nouns.append(lemma)
+
+    # 명사는 순서를 유지한 채 중복 제거
+    return " ".join(lemmas), list(dict.fromkeys(nouns))
+
+def get_preprocess_mapping(text_fields):
+    mapping = {}
+    for field in text_fields:
+        # lemma는 이미 분석된 결과이므로 공백 기준으로만 토큰화, 명사는 정확히 일치하는 keyword로 저장
+        mapping[f"{field}{LEMMA_SUFFIX}"] = {"type": "text", "analyzer": "whitespace"}
+        mapping[f"{field}{NOUNS_SUFFIX}"] = {"type": "keyword"}
+    return mapping
+
+def get_sentiment_mapping(sentiment_columns):
+    if not sentiment_columns:
+        return {}
+    return {SENTIMENT_FIELD: {"type": "float"}}
+
+def preprocess_documents(nlp, docs, text_fields, n_process=SPACY_N_PROCESS, batch_size=NLP_BATCH_SIZE):
+    # 문서 스트림 전체를 하나의 nlp.pipe로 처리 (멀티프로세스 워커는 색인 작업당 한 번만 생성)
+    if not text_fields:
+        yield from docs
+        return
+
+    # nlp.pipe는 입력 순서를 유지하므로, 문서당 컬럼 수만큼 결과를 받으면 해당 문서가 완성됨
+    pending = deque()
+
+    def texts():
+        for doc in docs:
+            pending.append(doc)
+            for field in text_fields:
+                yield str(doc.get(field) or "")
+
+    field_count = len(text_fields)
+    for i, parsed in enumerate(nlp.pipe(texts(), n_process=n_process, batch_size=batch_size)):
+        doc = pending[0]
+        field = text_fields[i % field_count]
+        if parsed.text:
+            lemma, nouns = extract_keywords(parsed)
+            doc[f"{field}{LEMMA_SUFFIX}"] = lemma
+            doc[f"{field}{NOUNS_SUFFIX}"] = nouns
+
+        if i % field_count == field_count - 1:
+            yield pending.popleft()
+
+def compute_sentiment(docs, sentiment_columns):
+    # 리뷰 본문 컬럼(예: Summary, Text)만 합쳐 색인 시 한 번만 감성 분석 (검색 시에는 저장된 값을 필터/부스팅에만 사용)
+    for doc in docs:
+        text = " ".join(str(doc[field]) for field in sentiment_columns if doc.get(field))
+        # 텍스트가 없는 문서는 중립(0.0)과 구분되도록 필드를 생략
+        if text:
+            doc[SENTIMENT_FIELD] = TextBlob(text).sentiment.polarity
+        yield doc